@@ -14,7 +14,7 @@ into the package namespace:
 
 __author__ = "`the Bloom lab <https://jbloomlab.org>`_"
 __email__ = "jbloom@fredhutch.org"
-__version__ = "0.7"
+__version__ = "0.8"
 __url__ = "https://github.com/jbloomlab/binarymap"
 
 from binarymap.binarymap import BinaryMap  # noqa: F401
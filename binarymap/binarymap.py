@@ -18,6 +18,8 @@ using a :class:`BinaryMap`.
 """
 
 import collections
+import functools
+import itertools
 import re
 
 import natsort
@@ -229,6 +231,25 @@ class BinaryMap:
     [2, 4]
     [3]
 
+    Demonstrate :meth:`BinaryMap.sub_str_to_sparse_row`, which gives the same
+    representation as the corresponding row of `binary_variants`:
+
+    >>> binmap.sub_str_to_sparse_row('M1C K3A').toarray()
+    array([[0, 1, 0, 0, 1]], dtype=int8)
+    >>> for ivar, sub in enumerate(binmap.substitution_variants):
+    ...     row = binmap.sub_str_to_sparse_row(sub)
+    ...     assert (row != binmap.binary_variants[[ivar]]).nnz == 0
+
+    Use :meth:`BinaryMap.sub_strs_to_csr` to convert many variants at once:
+
+    >>> binmap.sub_strs_to_csr(['A2C', 'M1A K3A']).toarray()
+    array([[0, 0, 1, 0, 0],
+           [1, 0, 0, 0, 1]], dtype=int8)
+    >>> binmap.sub_strs_to_csr(['A2C', 'M1A G4A'])
+    Traceback (most recent call last):
+      ...
+    ValueError: sub of G4A is not in the binary map. The map only contains substitutions in the variants.
+
     Specify allowed substitutions including one not in ``func_scores_df``:
 
     >>> allowed_subs = ['K3G', 'M1A', 'M1C', 'A2C', 'A2*', 'K3A']
@@ -242,6 +263,13 @@ class BinaryMap:
       ...
     ValueError: substitutions not in `allowed_subs`: ['A2C', 'K3A']
 
+    Nor can we initialize if a variant has multiple substitutions at a site:
+
+    >>> BinaryMap(pd.DataFrame({'aa_substitutions': ['M1A', 'M1A K3A M1C']}))
+    Traceback (most recent call last):
+      ...
+    ValueError: multiple subs at same site in M1A K3A M1C
+
     Now do similar operation but using `expand` to include full alphabet
     (although to keep size manageable, we use an alphabet smaller than
     all amino acids):
@@ -318,6 +346,13 @@ class BinaryMap:
     >>> binmap_counts.n_post
     array([ 0,  3, 12, 11,  9,  8])
 
+    Functional scores cannot be NaN:
+
+    >>> BinaryMap(func_scores_df.assign(func_score=numpy.nan))
+    Traceback (most recent call last):
+      ...
+    ValueError: some entries in func_score are NaN
+
     Use an alphabet that allows gaps:
 
     >>> func_scores_gap_df = pd.concat(
@@ -330,6 +365,22 @@ class BinaryMap:
     >>> bmap_gap.all_subs
     ['M1A', 'M1C', 'M1-', 'A2C', 'A2*', 'K3A']
 
+    Use an alphabet of codons:
+
+    >>> codon_df = pd.DataFrame({'codon_substitutions': ['ATG1GCT',
+    ...                                                  'ATG1TAA AAA3AAG']})
+    >>> BinaryMap(codon_df,
+    ...           substitutions_col='codon_substitutions',
+    ...           alphabet=['AAA', 'AAG', 'ATG', 'GCT', 'TAA']).all_subs
+    ['ATG1GCT', 'ATG1TAA', 'AAA3AAG']
+
+    But alphabet characters cannot contain digits, which are used for sites:
+
+    >>> BinaryMap(func_scores_df, alphabet=['A', 'C', 'M', '1'])
+    Traceback (most recent call last):
+      ...
+    ValueError: invalid alphabet character: '1'
+
     Use str as sites to enable letter suffixes on sites:
 
     >>> func_scores_sitestr_df = pd.concat(
@@ -372,13 +423,24 @@ class BinaryMap:
         ...                    'func_score_var': [0.1, 0.15]})
         >>> df2 = df.copy()
         >>> df3 = df.assign(func_score=lambda x: x['func_score'] + 0.1)
+        >>> df4 = df.assign(aa_substitutions=['M1A', ''])
         >>> bmap1 = BinaryMap(df)
         >>> bmap2 = BinaryMap(df2)
         >>> bmap3 = BinaryMap(df3)
+        >>> bmap4 = BinaryMap(df4)
         >>> bmap1 == bmap2
         True
         >>> bmap1 == bmap3
         False
+        >>> bmap1 == bmap4
+        False
+
+        Equality does not depend on dtype of the substitutions column:
+
+        >>> bmap_str = BinaryMap(df.astype({'aa_substitutions': str}))
+        >>> bmap_cat = BinaryMap(df.astype({'aa_substitutions': 'category'}))
+        >>> bmap1 == bmap_str == bmap_cat
+        True
 
         """
         # following here: https://stackoverflow.com/a/390640
@@ -395,7 +457,17 @@ class BinaryMap:
                     if not numpy.array_equal(val, val2):
                         return False
                 elif isinstance(val, scipy.sparse.csr_array):
-                    if (val - val2).nnz:
+                    if val.shape != val2.shape:
+                        return False
+                    elif val.has_canonical_format and val2.has_canonical_format:
+                        # canonical arrays equal only if underlying arrays equal
+                        if not (
+                            numpy.array_equal(val.indptr, val2.indptr)
+                            and numpy.array_equal(val.indices, val2.indices)
+                            and numpy.array_equal(val.data, val2.data)
+                        ):
+                            return False
+                    elif (val - val2).nnz:
                         return False
                 elif isinstance(val, (pd.DataFrame, pd.Series)):
                     if not val.equals(val2):
@@ -438,15 +510,20 @@ class BinaryMap:
                 else:
                     raise ValueError(f"`func_scores_df` lacks column {col}")
             else:
-                vals = func_scores_df[col].values.astype(dtype)
-                if not all(vals == func_scores_df[col].values):
+                orig_vals = func_scores_df[col].to_numpy()
+                vals = orig_vals.astype(dtype)  # copy so not a view of data frame
+                # only need to check cast did not change values if not same type
+                same_type = numpy.issubdtype(
+                    orig_vals.dtype, numpy.integer if dtype is int else numpy.floating
+                )
+                if not same_type and not numpy.array_equal(vals, orig_vals):
                     raise ValueError(f"{col} not of type {dtype}")
                 assert vals.shape == (self.nvariants,)
-                if any(numpy.isnan(vals)):
+                if numpy.isnan(vals).any():
                     raise ValueError(f"some entries in {col} are NaN")
-                if (lim_min is not None) and any(vals < lim_min):
+                if (lim_min is not None) and (vals < lim_min).any():
                     raise ValueError(f"some entries in {col} < {lim_min}")
-                if (lim_max is not None) and any(vals > lim_max):
+                if (lim_max is not None) and (vals > lim_max).any():
                     raise ValueError(f"some entries in {col} < {lim_min}")
                 setattr(self, attr, vals)
 
@@ -461,28 +538,12 @@ class BinaryMap:
         self.substitution_variants = substitutions
         self.substitutions_col = substitutions_col
 
-        # regex that matches substitution
-        chars = []
-        for char in alphabet:
-            if char.isalpha():
-                chars.append(char)
-            elif char == "*":
-                chars.append(r"\*")
-            elif char == "-":
-                chars.append(r"\-")
-            else:
-                raise ValueError(f"invalid alphabet character: {char}")
-        chars = "|".join(chars)
-        if self.sites_as_str:
-            site_regex = r"(?P<site>\-?\d+[a-z]?)"
-        else:
-            site_regex = r"(?P<site>\-?\d+)"
-        self._sub_regex = rf"(?P<wt>{chars})" + site_regex + rf"(?P<mut>{chars})"
+        _sub_regex(self.alphabet, self.sites_as_str)  # raises error if invalid
 
         # build mapping from substitution to binary map index
         wts = {}
         muts = collections.defaultdict(set)
-        subs_in_variants = {s for subs in substitutions for s in subs.split()}
+        subs_in_variants = set(" ".join(substitutions).split())
         if allowed_subs is not None:
             allowed_subs = set(allowed_subs)
             extra_subs = sorted(subs_in_variants - allowed_subs)
@@ -502,6 +563,7 @@ class BinaryMap:
             muts[site].add(mut)
         self._i_to_sub = {}
         self._wt_indices = {}  # keyed by site, values wildtype indices
+        self._sub_to_site = {}  # keyed by non-wildtype substitutions
         self.binary_sites = []
         if expand:
             if self.sites_as_str:
@@ -522,47 +584,60 @@ class BinaryMap:
                         "`wtseq` and `func_scores_df` differ on "
                         f"identity at site {site}"
                     )
-            i = 0
-            for site, wt in enumerate(wtseq, start=1):
-                assert (site not in wts) or (wts[site] == wt)
-                for char in self.alphabet:
-                    self.binary_sites.append(site)
-                    self._i_to_sub[i] = f"{wt}{site}{char}"
-                    if char == wt:
-                        assert site not in self._wt_indices
-                        self._wt_indices[site] = i
-                    i += 1
+            # every site has every character, in alphabet order
+            nchars = len(self.alphabet)
+            char_index = {c: i for i, c in enumerate(self.alphabet)}
+            self.binary_sites = numpy.repeat(numpy.arange(1, len(wtseq) + 1), nchars)
+            self._i_to_sub = dict(
+                enumerate(
+                    f"{wt}{site}{char}"
+                    for site, wt in enumerate(wtseq, start=1)
+                    for char in self.alphabet
+                )
+            )
+            self._wt_indices = {
+                site: (site - 1) * nchars + char_index[wt]
+                for site, wt in enumerate(wtseq, start=1)
+            }
+            self._sub_to_site = {
+                f"{wt}{site}{char}": site
+                for site, wt in enumerate(wtseq, start=1)
+                for char in self.alphabet
+                if char != wt
+            }
         else:
             if wtseq is not None:
                 raise ValueError("`wtseq` should be None if `expand` is False")
             i = 0
             char_order = {c: i for i, c in enumerate(self.alphabet)}
-            for site, wt in natsort.natsorted(wts.items(), alg=natsort.ns.SIGNED):
-                for mut in sorted(muts[site], key=lambda m: char_order[m[-1]]):
+            if self.sites_as_str:
+                sorted_wts = natsort.natsorted(wts.items(), alg=natsort.ns.SIGNED)
+            else:
+                sorted_wts = sorted(wts.items())  # int sites need no natsort
+            for site, wt in sorted_wts:
+                for mut in sorted(muts[site], key=lambda m: char_order[m]):
                     self.binary_sites.append(site)
                     self._i_to_sub[i] = f"{wt}{site}{mut}"
+                    self._sub_to_site[self._i_to_sub[i]] = site
                     i += 1
         self.binarylength = len(self._i_to_sub)
-        self.binary_sites = numpy.array(
+        self.binary_sites = numpy.asarray(
             self.binary_sites,
             dtype=str if self.sites_as_str else int,
         )
         self._sub_to_i = {sub: i for i, sub in self._i_to_sub.items()}
-        self._wt_index_set = set(self._wt_indices.values())
+        self._is_wt = numpy.zeros(self.binarylength, dtype=bool)
+        self._is_wt[list(self._wt_indices.values())] = True
+        # integer code for site of each index, in same order as sites; indices
+        # for each site are contiguous so codes increment where site changes
+        self._site_codes = numpy.zeros(self.binarylength, dtype=numpy.intp)
+        self._site_codes[1:] = numpy.cumsum(
+            self.binary_sites[1:] != self.binary_sites[:-1]
+        )
         assert len(self._sub_to_i) == len(self._i_to_sub) == self.binarylength
 
         # build binary_variants
-        row_ind = []  # row indices of elements that are one
-        col_ind = []  # column indices of elements that are one
-        for ivariant, subs in enumerate(substitutions):
-            for isub in self.sub_str_to_indices(subs):
-                row_ind.append(ivariant)
-                col_ind.append(isub)
-        self.binary_variants = scipy.sparse.csr_array(
-            (numpy.ones(len(row_ind), dtype="int8"), (row_ind, col_ind)),
-            shape=(self.nvariants, self.binarylength),
-            dtype="int8",
-        )
+        self.binary_variants = self.sub_strs_to_csr(substitutions)
 
     def sub_str_to_binary(self, sub_str):
         """Convert space-delimited substitutions to binary representation.
@@ -575,13 +650,122 @@ class BinaryMap:
         Returns
         -------
         numpy.ndarray of dtype `int8`
-            Binary representation.
+            Binary representation. If `binarylength` is large, consider
+            using :meth:`BinaryMap.sub_str_to_sparse_row` instead to avoid
+            allocating a dense array.
 
         """
         binrep = numpy.zeros(self.binarylength, dtype="int8")
         binrep[self.sub_str_to_indices(sub_str)] = 1
         return binrep
 
+    def sub_str_to_sparse_row(self, sub_str):
+        """Convert space-delimited substitutions to sparse binary representation.
+
+        Parameters
+        ----------
+        sub_str : str
+            Space-delimited substitutions.
+
+        Returns
+        -------
+        scipy.sparse.csr_array of dtype `int8`
+            Binary representation as sparse array of shape 1 by `binarylength`.
+
+        """
+        indices = numpy.array(self.sub_str_to_indices(sub_str), dtype=numpy.int32)
+        row = scipy.sparse.csr_array(
+            (
+                numpy.ones(len(indices), dtype="int8"),
+                indices,
+                numpy.array([0, len(indices)], dtype=numpy.int32),
+            ),
+            shape=(1, self.binarylength),
+            dtype="int8",
+        )
+        row.has_canonical_format = True
+        return row
+
+    def sub_strs_to_csr(self, sub_strs):
+        """Convert list of space-delimited substitutions to sparse binary array.
+
+        Note
+        ----
+        This method gives the same result as stacking the output of
+        :meth:`BinaryMap.sub_str_to_sparse_row` for each variant, but is
+        much faster for many variants.
+
+        Parameters
+        ----------
+        sub_strs : list
+            Space-delimited substitutions for each variant.
+
+        Returns
+        -------
+        scipy.sparse.csr_array of dtype `int8`
+            Sparse array of shape `len(sub_strs)` by `binarylength` where
+            row `i` is the binary representation of `sub_strs[i]`.
+
+        """
+        nvariants = len(sub_strs)
+        # iterate with map over built-in methods so loops run in C
+        splits = list(map(str.split, sub_strs))
+        counts = numpy.fromiter(map(len, splits), dtype=numpy.intp, count=nvariants)
+        try:
+            col_mut = numpy.fromiter(
+                map(self._sub_to_i.__getitem__, itertools.chain.from_iterable(splits)),
+                dtype=numpy.int32,
+                count=counts.sum(),
+            )
+        except KeyError:
+            valid = False
+        else:
+            # sort indices within each variant, which makes any substitutions at
+            # the same site adjacent as indices for each site are contiguous
+            row_mut = numpy.repeat(numpy.arange(nvariants, dtype=numpy.int32), counts)
+            col_mut = col_mut[
+                numpy.argsort(row_mut.astype(numpy.int64) * self.binarylength + col_mut)
+            ]
+            site_mut = self._site_codes[col_mut]
+            # no variant can have multiple substitutions at the same site
+            valid = not (
+                (row_mut[1:] == row_mut[:-1]) & (site_mut[1:] == site_mut[:-1])
+            ).any()
+            # wildtype indices are not valid substitutions
+            valid = valid and not self._is_wt[col_mut].any()
+        if not valid:
+            # use sub_str_to_indices to raise informative error
+            for sub_str in sub_strs:
+                self.sub_str_to_indices(sub_str)
+            raise ValueError("unexpected error, invalid variant not found")
+
+        if self._wt_indices:
+            # if expanded, each variant has one index per site that is wildtype
+            # unless site is mutated, so indices are sorted when placed by site
+            wt_cols = numpy.flatnonzero(self._is_wt).astype(numpy.int32)
+            variant_cols = numpy.tile(wt_cols, (nvariants, 1))
+            variant_cols[row_mut, site_mut] = col_mut
+            indices = variant_cols.ravel()
+            counts = numpy.full(nvariants, len(wt_cols), dtype=numpy.intp)
+        else:
+            indices = col_mut
+
+        # build CSR directly from indices sorted within each row; there are no
+        # duplicates as we checked for multiple subs at the same site
+        # use 32-bit indices unless too many elements, to halve memory
+        if len(indices) <= numpy.iinfo(numpy.int32).max:
+            indptr = numpy.zeros(nvariants + 1, dtype=numpy.int32)
+        else:
+            indptr = numpy.zeros(nvariants + 1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=indptr[1:])
+        binary = scipy.sparse.csr_array(
+            (numpy.ones(len(indices), dtype="int8"), indices, indptr),
+            shape=(nvariants, self.binarylength),
+            dtype="int8",
+        )
+        binary.has_canonical_format = True
+        return binary
+
     def sub_str_to_indices(self, sub_str):
         """Convert space-delimited substitutions to list of non-zero indices.
 
@@ -600,7 +784,10 @@ class BinaryMap:
         sites = set()
         indices = []
         for sub in sub_str.split():
-            wt, site, mut = self._parse_sub_str(sub)
+            if sub in self._sub_to_site:
+                site = self._sub_to_site[sub]
+            else:
+                site = self._parse_sub_str(sub)[1]  # raises error if invalid
             if site in sites:
                 raise ValueError(f"multiple subs at same site in {sub_str}")
             sites.add(site)
@@ -612,18 +799,7 @@ class BinaryMap:
 
     def _parse_sub_str(self, sub):
         """Parse substitution string to `(wt, site, mut)`."""
-        m = re.fullmatch(self._sub_regex, sub)
-        if not m:
-            raise ValueError(
-                f"substitution {sub} is invalid " f"for alphabet {self.alphabet}"
-            )
-        if m.group("wt") == m.group("mut"):
-            raise ValueError(f"wildtype and mutant identity the same in {sub}")
-        if self.sites_as_str:
-            site = m.group("site")
-        else:
-            site = int(m.group("site"))
-        return (m.group("wt"), site, m.group("mut"))
+        return _parse_sub_str(sub, self.alphabet, self.sites_as_str)
 
     def binary_to_sub_str(self, binary):
         """Convert binary representation to space-delimited substitutions.
@@ -647,10 +823,10 @@ class BinaryMap:
             raise ValueError(
                 f"`binary` not length {self.binarylength}:\n" + str(binary)
             )
-        if not set(binary).issubset({0, 1}):
+        if not ((binary == 0) | (binary == 1)).all():
             raise ValueError(f"`binary` not all 0 or 1:\n{binary}")
         subs = [s for s in map(self.i_to_sub, numpy.flatnonzero(binary)) if s]
-        sites = [self._parse_sub_str(sub)[1] for sub in subs]
+        sites = [self._sub_to_site[sub] for sub in subs]
         if len(sites) != len(set(sites)):
             raise ValueError(
                 "`binary` specifies multiple substitutions "
@@ -672,18 +848,17 @@ class BinaryMap:
             The substitution corresponding to that index.
 
         """
-        try:
-            if i in self._wt_index_set:
-                return ""
-            else:
-                return self._i_to_sub[i]
-        except KeyError:
-            if i < 0 or i >= self.binarylength:
-                raise ValueError(
-                    f"invalid i of {i}. Must be >= 0 and " f"< {self.binarylength}"
-                )
-            else:
-                raise ValueError(f"unexpected error, i = {i} should be in map")
+        if i < 0 or i >= self.binarylength:
+            raise ValueError(
+                f"invalid i of {i}. Must be >= 0 and " f"< {self.binarylength}"
+            )
+        elif i != int(i):
+            raise ValueError(f"invalid i of {i}. Must be an integer")
+        i = int(i)  # so integral floats can index `_is_wt`
+        if self._is_wt[i]:
+            return ""
+        else:
+            return self._i_to_sub[i]
 
     def sub_to_i(self, sub):
         """Index in binary representation corresponding to substitution.
@@ -712,11 +887,47 @@ class BinaryMap:
         """list: Substitutions in order encoded in binary map."""
         if not hasattr(self, "_all_subs"):
             self._all_subs = [
-                self.i_to_sub(i) for i in range(self.binarylength) if self.i_to_sub(i)
+                self._i_to_sub[i] for i in numpy.flatnonzero(~self._is_wt).tolist()
             ]
         return self._all_subs
 
 
+@functools.lru_cache
+def _sub_regex(alphabet, sites_as_str):
+    """Compiled regex matching substitutions for tuple `alphabet`."""
+    for char in alphabet:
+        # digits are not allowed as they would be ambiguous with site numbers
+        if not char or any(c.isspace() or c.isdigit() for c in char):
+            raise ValueError(f"invalid alphabet character: {char!r}")
+    # escape characters, and try longest first in case some are prefixes
+    chars = "|".join(sorted(map(re.escape, alphabet), key=len, reverse=True))
+    if sites_as_str:
+        site_regex = r"(?P<site>\-?\d+[a-z]?)"
+    else:
+        site_regex = r"(?P<site>\-?\d+)"
+    return re.compile(rf"(?P<wt>{chars})" + site_regex + rf"(?P<mut>{chars})")
+
+
+@functools.lru_cache(maxsize=2**16)
+def _parse_sub_str(sub, alphabet, sites_as_str):
+    """Parse substitution string to `(wt, site, mut)`.
+
+    Cached as the same substitutions are often parsed when creating
+    many :class:`BinaryMap` objects for overlapping sets of variants.
+
+    """
+    m = _sub_regex(alphabet, sites_as_str).fullmatch(sub)
+    if not m:
+        raise ValueError(f"substitution {sub} is invalid " f"for alphabet {alphabet}")
+    if m.group("wt") == m.group("mut"):
+        raise ValueError(f"wildtype and mutant identity the same in {sub}")
+    if sites_as_str:
+        site = m.group("site")
+    else:
+        site = int(m.group("site"))
+    return (m.group("wt"), site, m.group("mut"))
+
+
 if __name__ == "__main__":
     import doctest
 